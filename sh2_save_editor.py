@@ -4,7 +4,8 @@ Silent Hill 2 (2024 Remake) Save Game Editor
 Supports modifying health, weapon ammo, and inventory items
 """
 
-import zlib
+import mmap
+import re
 import struct
 import sys
 import os
@@ -12,62 +13,142 @@ import shutil
 from pathlib import Path
 from datetime import datetime
 
+try:
+    from zlib_ng import zlib_ng as zlib  # SIMD-accelerated, drop-in zlib API
+except ImportError:
+    import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import deflate  # libdeflate bindings: faster encoder, same zlib stream
+except ImportError:
+    deflate = None
+
+# Levels below 6 change the zlib header (78 01 / 78 5E), which load() can't find
+MIN_COMPRESSION_LEVEL = 6
+# Highest compression level supported by the active encoder
+MAX_COMPRESSION_LEVEL = 12 if deflate is not None else 9
+# Near level 9 output size at a fraction of the CPU time
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# zlib stream headers written at the default (6) and best (7+) levels
+ZLIB_MAGICS = (b'\x78\x9c', b'\x78\xda')
+
+# ioctl request for a copy-on-write file clone (linux/fs.h), not exposed before Python 3.12
+FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+
+# Item quantities: "Quantity" must end within this many bytes of the item
+# name's start, and the int32 value sits this many bytes after the tag
+QUANTITY_SEARCH_WINDOW = 100
+QUANTITY_VALUE_OFFSET = 34
+QUANTITY_TAG = b'Quantity\x00'
+
+# Serialized properties: name, NUL, int32 type-name length, type name, NUL,
+# 8 bytes of size/metadata, then the value
+PROPERTY_TAG_PATTERN = re.compile(rb'(Float|Int)Property\x00')
+MAX_PROPERTY_NAME_LENGTH = 255
+
+# Precompiled little-endian value layouts
+_LE_F32 = struct.Struct('<f')
+_LE_I32 = struct.Struct('<i')
+# Compressed size followed by uncompressed size
+_LE_II = struct.Struct('<II')
+
+
+def _check_compression_level(level):
+    """Reject levels that would write an unreadable header or that the encoder lacks"""
+    if not MIN_COMPRESSION_LEVEL <= level <= MAX_COMPRESSION_LEVEL:
+        raise ValueError(f"Compression level must be between {MIN_COMPRESSION_LEVEL} "
+                         f"and {MAX_COMPRESSION_LEVEL}, got {level}")
+
 
 class SH2SaveEditor:
     """Editor for Silent Hill 2 (2024 Remake) save files"""
     
-    def __init__(self, filename):
+    # Names looked up by display_info
+    WEAPONS = ['Pistol', 'Shotgun', 'Rifle', 'Handgun', 'SteelPipe']
+    INVENTORY_ITEMS = ['HealthDrink', 'Syringe', 'HandgunAmmo', 'ShotgunAmmo', 'ShotgunShells',
+                       'RifleAmmo', 'FirstAidKit']
+    
+    def __init__(self, filename, level=DEFAULT_COMPRESSION_LEVEL):
+        _check_compression_level(level)
         self.filename = filename
+        self.level = level
         self.save_data = None
         self.decompressed = None
+        self._prop_index = None
+        self._offset_cache = {}
         
     def load(self):
         """Load and decompress the save file"""
         with open(self.filename, 'rb') as f:
-            data = f.read()
-        
-        # Find zlib compression (can be at different offsets)
-        for i in range(0, 300):
-            if data[i:i+2] in (b'\x78\x9c', b'\x78\xda'):
-                compressed_size_offset = i - 8
-                # Format: COMPRESSED size first, then UNCOMPRESSED size
-                compressed_size = struct.unpack('<I', data[compressed_size_offset:compressed_size_offset+4])[0]
-                uncompressed_size = struct.unpack('<I', data[compressed_size_offset+4:compressed_size_offset+8])[0]
-                
-                compressed_data = data[i:i+compressed_size]
-                decompressed = zlib.decompress(compressed_data)
-                
-                self.save_data = {
-                    'header': data[:compressed_size_offset],
-                    'size_info_offset': compressed_size_offset,
-                    'compression_offset': i,
-                    'decompressed': decompressed,
-                    'uncompressed_size': uncompressed_size,
-                    'compressed_size': compressed_size
-                }
-                self.decompressed = bytearray(decompressed)
-                return True
+            if os.fstat(f.fileno()).st_size == 0:
+                return False
+            # Map the file read-only so header parsing and decompression
+            # work on views of it instead of a full in-memory copy
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._parse(data)
+    
+    def _parse(self, data):
+        """Locate and decompress the zlib stream in the raw file data"""
+        # Find zlib compression (can be at different offsets): the stream may
+        # start anywhere in the first 300 bytes, so its 2-byte magic may end at 301
+        candidates = [pos for pos in (data.find(magic, 0, 301) for magic in ZLIB_MAGICS) if pos != -1]
+        if not candidates:
+            return False
+        i = min(candidates)
         
-        return False
+        compressed_size_offset = i - 8
+        # Format: COMPRESSED size first, then UNCOMPRESSED size
+        compressed_size, uncompressed_size = _LE_II.unpack_from(data, compressed_size_offset)
+        
+        with memoryview(data) as view:
+            # Only the mutable copy is kept; holding on to the immutable
+            # result as well would double the memory used by the save
+            self.decompressed = bytearray(zlib.decompress(view[i:i+compressed_size]))
+        
+        self.save_data = {
+            'header': data[:compressed_size_offset],
+            'size_info_offset': compressed_size_offset,
+            'compression_offset': i,
+            'uncompressed_size': uncompressed_size,
+            'compressed_size': compressed_size
+        }
+        # Setters overwrite values in place and never resize the buffer,
+        # so resolved offsets stay valid until the next load
+        self._prop_index = None
+        self._offset_cache = {}
+        return True
     
     def save(self, output_filename=None):
         """Save the modified save file"""
         if output_filename is None:
             output_filename = self.filename
         
-        # Compress the modified data
-        compressed = zlib.compress(bytes(self.decompressed), level=9)
+        _check_compression_level(self.level)
+        
+        # Compress the modified data (libdeflate when available, otherwise zlib);
+        # both accept the bytearray directly, so it is not copied first
+        if deflate is not None:
+            compressed = deflate.zlib_compress(self.decompressed, self.level)
+        else:
+            compressed = zlib.compress(self.decompressed, level=self.level)
         
         # Update sizes
         new_uncompressed_size = len(self.decompressed)
         new_compressed_size = len(compressed)
         
-        # Rebuild the file
+        # Rebuild the file in one allocation
         # IMPORTANT: The format is COMPRESSED size first, then UNCOMPRESSED size
-        new_file = bytearray(self.save_data['header'])
-        new_file.extend(struct.pack('<I', new_compressed_size))    # At 0x89 (or similar): compressed size
-        new_file.extend(struct.pack('<I', new_uncompressed_size))  # At 0x8D (or similar): uncompressed size
-        new_file.extend(compressed)
+        new_file = b''.join((
+            self.save_data['header'],
+            _LE_II.pack(new_compressed_size, new_uncompressed_size),  # At 0x89 (or similar)
+            compressed,
+        ))
         
         # Write to file
         with open(output_filename, 'wb') as f:
@@ -77,86 +158,144 @@ class SH2SaveEditor:
         print(f"  Original size: {self.save_data['uncompressed_size']:,} bytes")
         print(f"  New size: {new_uncompressed_size:,} bytes")
     
+    def _scan_properties(self):
+        """Map (name, type) of every Float/IntProperty tag to its value offset"""
+        index = {}
+        for match in PROPERTY_TAG_PATTERN.finditer(self.decompressed):
+            # The property name's NUL sits just before the 4-byte type-name length
+            name_end = match.start() - 5
+            if name_end < 1 or self.decompressed[name_end] != 0:
+                continue
+            
+            # The name starts after the previous NUL (the high byte of its int32
+            # length prefix); the prefix must agree with the name's length
+            name_start = self.decompressed.rfind(b'\x00', max(name_end - MAX_PROPERTY_NAME_LENGTH, 0), name_end) + 1
+            if name_start < 4 or name_start == name_end:
+                continue
+            if _LE_I32.unpack_from(self.decompressed, name_start - 4)[0] != name_end - name_start + 1:
+                continue
+            
+            name = self.decompressed[name_start:name_end].decode('latin-1')
+            data_type = 'float' if match.group(1) == b'Float' else 'int'
+            index.setdefault((name, data_type), match.end() + 8)
+        return index
+    
+    def _find_name(self, name):
+        """Find the first occurrence of a null-terminated name"""
+        # bytearray.find reads the buffer in place through the buffer
+        # protocol, so no bytes() snapshot of the save is needed; results
+        # are memoised per caller in _offset_cache
+        return self.decompressed.find(name.encode() + b'\x00')
+    
     def _find_property_offset(self, property_name, data_type='float'):
         """Find offset of a property value"""
-        pos = self.decompressed.find(property_name.encode() + b'\x00')
-        if pos == -1:
-            return -1
+        key = (property_name, data_type)
+        if key in self._offset_cache:
+            return self._offset_cache[key]
         
-        # Skip: string + null + "FloatProperty"/"IntProperty" + null + size (4) + metadata (8)
         if data_type == 'float':
             type_name = b'FloatProperty\x00'
         else:
             type_name = b'IntProperty\x00'
         
-        offset = pos + len(property_name) + 1 + len(type_name) + 4 + 8
+        # Layout: string + null + size (4) + "FloatProperty"/"IntProperty" + null + metadata (8)
+        pos = self._find_name(property_name)
+        tag_start = pos + len(property_name) + 1 + 4
+        if pos != -1 and self.decompressed[tag_start:tag_start+len(type_name)] == type_name:
+            offset = tag_start + len(type_name) + 8
+        else:
+            # The first verbatim hit is missing or isn't followed by its type
+            # tag; fall back to the tag scan, built once per load
+            if self._prop_index is None:
+                self._prop_index = self._scan_properties()
+            offset = self._prop_index.get(key, -1)
+        
+        self._offset_cache[key] = offset
         return offset
     
     def _find_weapon_offset(self, weapon_name):
         """Find offset of weapon ammo count"""
-        pos = self.decompressed.find(weapon_name.encode() + b'\x00')
+        key = (weapon_name, 'weapon')
+        if key in self._offset_cache:
+            return self._offset_cache[key]
+        
+        pos = self._find_name(weapon_name)
         if pos == -1:
-            return -1
+            offset = -1
+        else:
+            # Ammo is stored as int32 right after weapon name + null
+            offset = pos + len(weapon_name) + 1
         
-        # Ammo is stored as int32 right after weapon name + null
-        return pos + len(weapon_name) + 1
+        self._offset_cache[key] = offset
+        return offset
+    
+    def _read_f32(self, offset):
+        """Read a little-endian float32 from the decompressed data"""
+        return _LE_F32.unpack_from(self.decompressed, offset)[0]
+    
+    def _read_i32(self, offset):
+        """Read a little-endian int32 from the decompressed data"""
+        return _LE_I32.unpack_from(self.decompressed, offset)[0]
     
     def get_health(self):
         """Get current health value"""
         offset = self._find_property_offset('HealthValue', 'float')
-        if offset > 0:
-            return struct.unpack('<f', self.decompressed[offset:offset+4])[0]
+        if offset > 0 and offset + 4 <= len(self.decompressed):
+            return self._read_f32(offset)
         return None
     
     def set_health(self, value):
         """Set health value"""
         offset = self._find_property_offset('HealthValue', 'float')
-        if offset > 0:
-            self.decompressed[offset:offset+4] = struct.pack('<f', float(value))
+        if offset > 0 and offset + 4 <= len(self.decompressed):
+            _LE_F32.pack_into(self.decompressed, offset, float(value))
             return True
         return False
     
     def get_weapon_ammo(self, weapon_name):
         """Get weapon ammo count"""
         offset = self._find_weapon_offset(weapon_name)
-        if offset > 0:
-            return struct.unpack('<i', self.decompressed[offset:offset+4])[0]
+        if offset > 0 and offset + 4 <= len(self.decompressed):
+            return self._read_i32(offset)
         return None
     
     def set_weapon_ammo(self, weapon_name, amount):
         """Set weapon ammo count"""
         offset = self._find_weapon_offset(weapon_name)
-        if offset > 0:
-            self.decompressed[offset:offset+4] = struct.pack('<i', int(amount))
+        if offset > 0 and offset + 4 <= len(self.decompressed):
+            _LE_I32.pack_into(self.decompressed, offset, int(amount))
             return True
         return False
     
     def _find_item_quantity_offset(self, item_name):
         """Find offset of item quantity in CollectedItems"""
-        pos = self.decompressed.find(item_name.encode() + b'\x00')
-        if pos == -1:
-            return -1
+        key = (item_name, 'item')
+        if key in self._offset_cache:
+            return self._offset_cache[key]
         
-        # Find Quantity after item name
-        qty_pos = self.decompressed.find(b'Quantity\x00', pos, pos + 100)
-        if qty_pos == -1:
-            return -1
+        offset = -1
+        pos = self._find_name(item_name)
+        if pos != -1:
+            # Find Quantity after item name
+            qty_pos = self.decompressed.find(QUANTITY_TAG, pos, pos + QUANTITY_SEARCH_WINDOW)
+            if qty_pos != -1:
+                offset = qty_pos + QUANTITY_VALUE_OFFSET
         
-        # The value is 34 bytes after "Quantity" string
-        return qty_pos + 34
+        self._offset_cache[key] = offset
+        return offset
     
     def get_item_quantity(self, item_name):
         """Get quantity of an inventory item"""
         offset = self._find_item_quantity_offset(item_name)
         if offset > 0 and offset + 4 <= len(self.decompressed):
-            return struct.unpack('<i', self.decompressed[offset:offset+4])[0]
+            return self._read_i32(offset)
         return None
     
     def set_item_quantity(self, item_name, amount):
         """Set quantity of an inventory item"""
         offset = self._find_item_quantity_offset(item_name)
         if offset > 0 and offset + 4 <= len(self.decompressed):
-            self.decompressed[offset:offset+4] = struct.pack('<i', int(amount))
+            _LE_I32.pack_into(self.decompressed, offset, int(amount))
             return True
         return False
     
@@ -172,10 +311,9 @@ class SH2SaveEditor:
             print(f"Health: {health:.2f}")
         
         # Check various weapons
-        weapons = ['Pistol', 'Shotgun', 'Rifle', 'Handgun', 'SteelPipe']
         print("\nWeapon Ammo:")
         found_weapons = False
-        for weapon in weapons:
+        for weapon in self.WEAPONS:
             ammo = self.get_weapon_ammo(weapon)
             if ammo is not None:
                 print(f"  {weapon}: {ammo}")
@@ -184,11 +322,9 @@ class SH2SaveEditor:
             print("  (No weapons found)")
         
         # Check inventory items
-        inventory_items = ['HealthDrink', 'Syringe', 'HandgunAmmo', 'ShotgunAmmo', 'ShotgunShells', 
-                          'RifleAmmo', 'FirstAidKit']
         print("\nInventory Items:")
         found_items = False
-        for item in inventory_items:
+        for item in self.INVENTORY_ITEMS:
             quantity = self.get_item_quantity(item)
             if quantity is not None:
                 print(f"  {item}: {quantity}")
@@ -197,6 +333,27 @@ class SH2SaveEditor:
             print("  (No items found)")
 
 
+def _clone_file(src, dst):
+    """Try a copy-on-write clone (Btrfs, XFS); returns False if unsupported"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+    
+    # The clone already holds the full contents; missing metadata is not fatal
+    try:
+        shutil.copystat(src, dst)
+    except OSError:
+        pass
+    return True
+
+
 def create_backup(filename):
     """Create a timestamped backup of the save file"""
     if not os.path.exists(filename):
@@ -206,7 +363,9 @@ def create_backup(filename):
     backup_name = f"{filename}.backup_{timestamp}"
     
     try:
-        shutil.copy2(filename, backup_name)
+        # shutil.copy2 already uses sendfile/fcopyfile where available
+        if not _clone_file(filename, backup_name):
+            shutil.copy2(filename, backup_name)
         print(f"✓ Backup created: {backup_name}")
         return backup_name
     except Exception as e:
@@ -232,6 +391,7 @@ def main():
         print("  --shotgunammo <qty>       Set shotgun ammo (inventory item)")
         print("  --rifleammo <qty>         Set rifle ammo (inventory item)")
         print("  --output <file>           Output filename (default: overwrites input)")
+        print(f"  --compression-level <n>   Compression level {MIN_COMPRESSION_LEVEL}-{MAX_COMPRESSION_LEVEL} (default: {DEFAULT_COMPRESSION_LEVEL})")
         print("  --no-backup               Skip creating backup (not recommended)")
         print("\nExamples:")
         print("  python sh2_save_editor.py SaveGameData_2.sav --info")
@@ -318,6 +478,16 @@ def main():
             output_file = sys.argv[i + 1]
             i += 1
         
+        elif arg == '--compression-level' and i + 1 < len(sys.argv):
+            value = int(sys.argv[i + 1])
+            try:
+                _check_compression_level(value)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            editor.level = value
+            i += 1
+        
         i += 1
     
     # Apply modifications